@@ -0,0 +1,29 @@
+"""One-time export of the retrained Random Forest to ONNX for rf.py.
+
+Run after retraining:  python export_onnx.py
+
+The forest is exported on its own, taking the dense float32 TF-IDF rows
+produced by rf.fast_tfidf, so the vectorizer and label encoder stay
+Python-side.
+"""
+import os
+
+import joblib
+from skl2onnx import convert_sklearn
+from skl2onnx.common.data_types import FloatTensorType
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+MODEL_PATH = os.path.join(BASE_DIR, "random_forest_model_retrained.pkl")
+ONNX_MODEL_PATH = os.path.join(BASE_DIR, "random_forest_model_retrained.onnx")
+
+if __name__ == "__main__":
+    model = joblib.load(MODEL_PATH)
+    onnx_model = convert_sklearn(
+        model,
+        initial_types=[("input", FloatTensorType([None, model.n_features_in_]))],
+        options={id(model): {"zipmap": False}},
+        target_opset={"": 17, "ai.onnx.ml": 3},
+    )
+    with open(ONNX_MODEL_PATH, "wb") as f:
+        f.write(onnx_model.SerializeToString())
+    print(f"✅ Exported {MODEL_PATH} -> {ONNX_MODEL_PATH}")
@@ -0,0 +1,80 @@
+"""One-off migration of BSON date timestamps to epoch milliseconds for rf.py.
+
+Run once after upgrading:  python migrate_timestamps.py
+
+Older versions stored timestamps as BSON dates; rf.py now stores integer
+milliseconds. This converts the top-level timestamp of complaints and
+activity entries as well as comments[].timestamp and admin_notes[].timestamp.
+Until it has run, sorting by timestamp puts every legacy date after every
+new entry, because BSON orders all numbers before all dates.
+
+The conversion is done client-side with plain $type queries and $set
+updates, so it works on any MongoDB version and is safe to re-run.
+"""
+import datetime
+import os
+
+from pymongo import MongoClient, UpdateOne
+
+MONGODB_URI = os.getenv("MONGODB_URI", "mongodb://localhost:27017/")
+DB_NAME = "municipal_complaints"
+COLLECTION_NAME = "complaints"
+BATCH_SIZE = 1000
+
+
+def _to_ms(value):
+    """Convert a datetime to epoch ms (same formula as rf.timestamp_ms), leaving other values alone"""
+    if isinstance(value, datetime.datetime):
+        return int(value.replace(tzinfo=datetime.timezone.utc).timestamp() * 1000)
+    return value
+
+
+def _array_to_ms(entries):
+    """Copy of an array field with every entry's timestamp converted"""
+    if not isinstance(entries, list):
+        return entries
+    return [
+        {**entry, "timestamp": _to_ms(entry["timestamp"])}
+        if isinstance(entry, dict) and "timestamp" in entry else entry
+        for entry in entries
+    ]
+
+
+def migrate(collection, array_fields=()) -> int:
+    """Convert date timestamps in one collection, returning the number of documents changed"""
+    query = {"$or": [{"timestamp": {"$type": "date"}}] + [
+        {f"{field}.timestamp": {"$type": "date"}} for field in array_fields
+    ]}
+    projection = ["timestamp", *array_fields]
+
+    modified = 0
+    operations = []
+    for document in collection.find(query, projection):
+        update = {}
+        if "timestamp" in document:
+            update["timestamp"] = _to_ms(document["timestamp"])
+        for field in array_fields:
+            if field in document:
+                update[field] = _array_to_ms(document[field])
+        # Only update if the fields are unchanged since they were read, so a
+        # comment pushed meanwhile isn't overwritten; a re-run picks it up
+        guard = {field: document[field] for field in update}
+        operations.append(UpdateOne({"_id": document["_id"], **guard}, {"$set": update}))
+
+        if len(operations) >= BATCH_SIZE:
+            modified += collection.bulk_write(operations, ordered=False).modified_count
+            operations = []
+    if operations:
+        modified += collection.bulk_write(operations, ordered=False).modified_count
+    return modified
+
+
+if __name__ == "__main__":
+    with MongoClient(MONGODB_URI) as client:
+        db = client[DB_NAME]
+
+        count = migrate(db[COLLECTION_NAME], ("comments", "admin_notes"))
+        print(f"✅ Migrated {count} complaints")
+
+        count = migrate(db["activity"])
+        print(f"✅ Migrated {count} activity entries")
@@ -1,19 +1,61 @@
-from flask import Flask, request, jsonify, send_from_directory
+from flask import Flask, request, send_from_directory
 from flask_cors import CORS
-from pymongo import MongoClient
+from pymongo import MongoClient, ReturnDocument
+from pymongo.errors import ConnectionFailure, OperationFailure
+from pymongo.write_concern import WriteConcern
 import joblib
 import datetime
+import onnxruntime as ort
 import os
+import queue
+import re
+import threading
+import time
 import uuid
-from typing import Dict, List, Optional
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
 from werkzeug.utils import secure_filename
-import json
+import msgspec
+import orjson
+import ahocorasick
+import numpy as np
+from numba import njit
 
 app = Flask(__name__)
 CORS(app)  # Allow frontend to communicate with Flask
 
+def json_response(obj, status=200):
+    """Serialize a response body with orjson"""
+    return app.response_class(
+        orjson.dumps(obj, option=orjson.OPT_NAIVE_UTC | orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS),
+        status=status,
+        mimetype="application/json"
+    )
+
+def now_ms() -> int:
+    """Current UTC time as integer milliseconds since the epoch (used for all timestamps)"""
+    return time.time_ns() // 1_000_000
+
+def timestamp_ms(value):
+    """Convert a BSON date stored by older versions to epoch milliseconds; other values pass through"""
+    if isinstance(value, datetime.datetime):
+        # Not yet converted by migrate_timestamps.py; naive datetimes from pymongo are UTC
+        return int(value.replace(tzinfo=datetime.timezone.utc).timestamp() * 1000)
+    return value
+
+def normalize_timestamps(complaint: Dict[str, Any]) -> Dict[str, Any]:
+    """Make the complaint's own, comment and admin note timestamps all epoch milliseconds"""
+    if "timestamp" in complaint:
+        complaint["timestamp"] = timestamp_ms(complaint["timestamp"])
+    for field in ("comments", "admin_notes"):
+        for entry in complaint.get(field) or []:
+            if isinstance(entry, dict) and "timestamp" in entry:
+                entry["timestamp"] = timestamp_ms(entry["timestamp"])
+    return complaint
+
 # Configuration
 MONGODB_URI = os.getenv("MONGODB_URI", "mongodb://localhost:27017/")
+ATLAS_SEARCH_INDEX = os.getenv("ATLAS_SEARCH_INDEX")  # Atlas Search index name; $text is used when unset
 DB_NAME = "municipal_complaints"
 COLLECTION_NAME = "complaints"
 MODEL_VERSION = "1.2.0"
@@ -25,36 +67,209 @@ if not os.path.exists(UPLOAD_FOLDER):
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max upload
 
+# Photos are written to disk in the background so requests don't block on I/O.
+# The semaphore caps how many uploads (up to 16MB each) may wait in memory.
+UPLOAD_EXECUTOR = ThreadPoolExecutor(max_workers=4)
+UPLOAD_MAX_PENDING = 8
+_upload_slots = threading.BoundedSemaphore(UPLOAD_MAX_PENDING)
+
+def _record_photo(complaint_id: str, photo_filename: str) -> None:
+    """Point a complaint at a photo that has been written to disk"""
+    complaints_collection.update_one(
+        {"_id": complaint_id},
+        {"$set": {"has_photo": True, "photo_path": photo_filename}}
+    )
+
+def _write_upload(complaint_id: str, photo_path: str, photo_filename: str, data: bytes) -> None:
+    """Write uploaded photo bytes, then record them on the complaint (runs on UPLOAD_EXECUTOR)"""
+    try:
+        with open(photo_path, "wb") as f:
+            f.write(data)
+        _record_photo(complaint_id, photo_filename)
+        print(f"Photo saved at: {photo_path}")
+    except Exception as e:
+        print(f"Error saving photo: {e}")
+    finally:
+        _upload_slots.release()
+
 # Connect to MongoDB
 try:
-    client = MongoClient(MONGODB_URI)
+    # connect=False: nothing opens a connection until the first request, so each
+    # gunicorn worker forked after --preload starts its own connection pool
+    client = MongoClient(MONGODB_URI, connect=False)
     db = client[DB_NAME]
     complaints_collection = db[COLLECTION_NAME]
     activity_collection = db["activity"]  # Add activity collection
+    # Unacknowledged handle for audit logging so requests don't wait on the write
+    activity_log_collection = db.get_collection("activity", write_concern=WriteConcern(w=0))
     print("\u2705 MongoDB connected successfully!")
 except Exception as e:
     print(f"\u274c MongoDB connection error: {e}")
     db = None
 
+SETUP_TIMEOUT_MS = 3000  # Give up on startup index creation quickly if MongoDB is down
+
+def ensure_indexes(database) -> None:
+    """Create the indexes used by the list, search and activity endpoints"""
+    complaints = database[COLLECTION_NAME]
+    activity = database["activity"]
+
+    indexes = [
+        (complaints, [("category", 1), ("status", 1), ("timestamp", -1)]),
+        (complaints, [("priority_score", -1), ("votes", -1), ("timestamp", -1)]),
+        (complaints, [("submitted_by", 1)]),
+        (activity, [("timestamp", -1)]),
+        (complaints, [("complaint", "text")]),
+    ]
+    try:
+        # One ping up front so an unreachable server fails fast, once
+        database.client.admin.command("ping")
+
+        # Older versions created a text index on "complaint_text", which is never
+        # stored; only one text index is allowed, so drop it before creating ours
+        try:
+            if "complaint_text_text" in complaints.index_information():
+                complaints.drop_index("complaint_text_text")
+        except OperationFailure as e:
+            print(f"Warning: Could not drop stale text index: {e}")
+
+        # Each index gets its own try so one conflict can't block the others
+        for collection, keys in indexes:
+            try:
+                collection.create_index(keys)
+            except OperationFailure as e:
+                print(f"Warning: Could not create index {keys} on {collection.name}: {e}")
+    except ConnectionFailure as e:
+        print(f"Warning: MongoDB unreachable, skipping index creation: {e}")
+
+# Create indexes once at startup rather than on every request, on a
+# short-lived client so the shared client above is never opened before fork
+if db is not None:
+    try:
+        with MongoClient(MONGODB_URI, serverSelectionTimeoutMS=SETUP_TIMEOUT_MS) as setup_client:
+            ensure_indexes(setup_client[DB_NAME])
+    except Exception as e:
+        print(f"Warning: Could not create indexes: {e}")
+
 # Define paths for ML components
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 MODEL_PATH = os.path.join(BASE_DIR, "random_forest_model_retrained.pkl")
+ONNX_MODEL_PATH = os.path.join(BASE_DIR, "random_forest_model_retrained.onnx")  # Built by export_onnx.py
 VECTORIZER_PATH = os.path.join(BASE_DIR, "tfidf_vectorizer_retrained.pkl")
 ENCODER_PATH = os.path.join(BASE_DIR, "label_encoder_retrained.pkl")
 
 # Load ML components
 try:
-    model = joblib.load(MODEL_PATH) if os.path.exists(MODEL_PATH) else None
+    # Single-threaded sessions: no thread pool to lose when gunicorn --preload forks workers
+    onnx_options = ort.SessionOptions()
+    onnx_options.intra_op_num_threads = 1
+    onnx_options.inter_op_num_threads = 1
+    onnx_session = ort.InferenceSession(ONNX_MODEL_PATH, onnx_options, providers=["CPUExecutionProvider"]) if os.path.exists(ONNX_MODEL_PATH) else None
+    # The pickled forest is only needed when no ONNX export is available
+    model = joblib.load(MODEL_PATH) if onnx_session is None and os.path.exists(MODEL_PATH) else None
     tfidf_vectorizer = joblib.load(VECTORIZER_PATH) if os.path.exists(VECTORIZER_PATH) else None
     label_encoder = joblib.load(ENCODER_PATH) if os.path.exists(ENCODER_PATH) else None
 
-    if all([model, tfidf_vectorizer, label_encoder]):
-        print(f"\u2705 All ML components loaded successfully! (v{MODEL_VERSION})")
+    if all([onnx_session or model, tfidf_vectorizer, label_encoder]):
+        print(f"\u2705 All ML components loaded successfully! (v{MODEL_VERSION}, {'onnx' if onnx_session else 'sklearn'})")
     else:
         print("\u26A0 Warning: Some ML components are missing!")
 except Exception as e:
     print(f"\u274c Error loading ML components: {e}")
-    model, tfidf_vectorizer, label_encoder = None, None, None
+    onnx_session, model, tfidf_vectorizer, label_encoder = None, None, None, None
+
+# Single-document TF-IDF fast path (avoids sklearn's per-call CSR overhead)
+@njit
+def _tfidf_kernel(token_ids, idf):
+    vector = np.zeros(idf.shape[0], dtype=np.float32)
+    for i in token_ids:
+        vector[i] += idf[i]
+    norm = np.sqrt((vector * vector).sum())
+    if norm > 0:
+        vector /= norm
+    return vector
+
+VOCAB, IDF, ANALYZER = None, None, None
+if tfidf_vectorizer:
+    VOCAB = tfidf_vectorizer.vocabulary_
+    IDF = tfidf_vectorizer.idf_.astype(np.float32)
+    ANALYZER = tfidf_vectorizer.build_analyzer()
+
+def fast_tfidf(text: str) -> np.ndarray:
+    """Transform a single document into a dense, L2-normalised TF-IDF row"""
+    token_ids = np.fromiter(
+        (VOCAB[token] for token in ANALYZER(text) if token in VOCAB),
+        dtype=np.int64
+    )
+    return _tfidf_kernel(token_ids, IDF).reshape(1, -1)
+
+if tfidf_vectorizer:
+    fast_tfidf("")  # Compile the kernel at startup rather than on first request
+
+# Specialized forest predictor for when the pickled model is used (no ONNX
+# export): every tree is flattened into shared node arrays and walked in a
+# single njit loop, skipping sklearn's per-tree Python dispatch
+FAST_FOREST_MAX_NODES = 200_000  # Larger forests stay on model.predict
+
+def _is_small_forest(forest) -> bool:
+    """Check whether a fitted forest is small enough for the numba predictor"""
+    estimators = getattr(forest, "estimators_", None)
+    if not estimators:
+        return False
+    return sum(tree.tree_.node_count for tree in estimators) <= FAST_FOREST_MAX_NODES
+
+@njit
+def _forest_kernel(X, roots, left, right, feature, threshold, value):
+    predictions = np.empty(X.shape[0], dtype=np.int64)
+    for sample in range(X.shape[0]):
+        votes = np.zeros(value.shape[1])
+        for root in roots:
+            node = root
+            while left[node] != -1:
+                if X[sample, feature[node]] <= threshold[node]:
+                    node = left[node]
+                else:
+                    node = right[node]
+            votes += value[node]
+        predictions[sample] = np.argmax(votes)
+    return predictions
+
+def _flatten_forest(forest) -> tuple:
+    """Concatenate the node arrays of every tree, offsetting child indices"""
+    roots, left, right, feature, threshold, value = [], [], [], [], [], []
+    offset = 0
+    for estimator in forest.estimators_:
+        tree = estimator.tree_
+        roots.append(offset)
+        left.append(np.where(tree.children_left == -1, -1, tree.children_left + offset))
+        right.append(np.where(tree.children_right == -1, -1, tree.children_right + offset))
+        feature.append(tree.feature)
+        threshold.append(tree.threshold)
+        # Leaf class distributions, normalised like DecisionTreeClassifier.predict_proba
+        leaf_values = tree.value[:, 0, :]
+        leaf_totals = leaf_values.sum(axis=1, keepdims=True)
+        value.append(leaf_values / np.where(leaf_totals == 0, 1, leaf_totals))
+        offset += tree.node_count
+    return (
+        np.array(roots, dtype=np.int64),
+        np.concatenate(left).astype(np.int64),
+        np.concatenate(right).astype(np.int64),
+        np.concatenate(feature).astype(np.int64),
+        np.concatenate(threshold).astype(np.float64),
+        np.concatenate(value).astype(np.float64)
+    )
+
+FOREST_ARRAYS = None
+if _is_small_forest(model):
+    FOREST_ARRAYS = _flatten_forest(model)
+    print(f"\u2705 Using fast forest predictor ({len(model.estimators_)} trees, {len(FOREST_ARRAYS[1])} nodes)")
+
+def fast_forest_predict(complaint_tfidf: np.ndarray) -> np.ndarray:
+    """Predict encoded class labels for dense TF-IDF rows with the flattened forest"""
+    return model.classes_[_forest_kernel(complaint_tfidf, *FOREST_ARRAYS)]
+
+if FOREST_ARRAYS is not None and tfidf_vectorizer:
+    fast_forest_predict(fast_tfidf(""))  # Compile the kernel at startup
 
 # Define your categories and keywords
 CATEGORIES = [
@@ -65,6 +280,7 @@ CATEGORIES = [
     "Drainage Issues",
     "Other"
 ]
+CATEGORIES_SET = frozenset(CATEGORIES)
 
 # Enhanced category mapping with more keywords
 CATEGORY_KEYWORDS = {
@@ -76,28 +292,94 @@ CATEGORY_KEYWORDS = {
     "Other": ["noise", "loudspeaker", "park", "tree", "animal", "stray", "public", "nuisance"]
 }
 
+# Single automaton over all keywords so detection is one pass over the text.
+# Each keyword maps to (priority, category); lower priority wins, preserving
+# the CATEGORY_KEYWORDS ordering when several categories match.
+KEYWORD_AUTOMATON = ahocorasick.Automaton()
+for priority, (category, keywords) in enumerate(CATEGORY_KEYWORDS.items()):
+    for keyword in keywords:
+        keyword = keyword.lower()
+        if KEYWORD_AUTOMATON.get(keyword, None) is None:
+            KEYWORD_AUTOMATON.add_word(keyword, (priority, category))
+KEYWORD_AUTOMATON.make_automaton()
+
 def manual_category_detection(complaint_text: str) -> Optional[str]:
-    """Check if complaint should be manually categorized based on keywords"""
-    complaint_text = complaint_text.lower()
-    for category, keywords in CATEGORY_KEYWORDS.items():
-        if any(keyword.lower() in complaint_text for keyword in keywords):
-            print(f"🔧 Manual keyword match: {category}")
-            return category
-    return None
+    """Check if a lowercased complaint should be manually categorized based on keywords"""
+    best = None
+    for _, match in KEYWORD_AUTOMATON.iter(complaint_text):
+        if best is None or match[0] < best[0]:
+            best = match
+            if best[0] == 0:
+                break
+    return best[1] if best is not None else None
+
+# Priority boost keywords, matched at word starts so "urgently" still counts
+PRIORITY_HIGH_PATTERN = re.compile(r"\b(?:urgent|emergency)")
+PRIORITY_MEDIUM_PATTERN = re.compile(r"\b(?:soon|important)")
 
 def validate_prediction(predicted_category: str, complaint_text: str) -> str:
     """Ensure predicted category makes sense for the complaint"""
-    complaint_text = complaint_text.lower()
-    
     # If prediction is not in our defined categories, default to Other
-    if predicted_category not in CATEGORIES:
-        return "Other"
-    
-    return predicted_category
+    return predicted_category if predicted_category in CATEGORIES_SET else "Other"
+
+def predict_categories(complaint_texts: List[str]) -> List[str]:
+    """Run the ML model over a batch of lowercased complaint texts"""
+    complaint_tfidf = np.vstack([fast_tfidf(text) for text in complaint_texts])
+    if onnx_session:
+        predicted_category_nums = onnx_session.run(["label"], {"input": complaint_tfidf})[0]
+    elif FOREST_ARRAYS is not None:
+        predicted_category_nums = fast_forest_predict(complaint_tfidf)
+    else:
+        predicted_category_nums = model.predict(complaint_tfidf)
+    return list(label_encoder.inverse_transform(predicted_category_nums))
+
+# Micro-batching for /predict_category: requests that queue up while the
+# forest is busy are coalesced so it runs once for all of them. A lone
+# request is predicted immediately; nothing ever waits for a batch to fill
+PREDICT_BATCH_SIZE = 64
+PREDICT_TIMEOUT = 2  # seconds a request waits for its batch result
+
+_predict_queue = queue.Queue()
+_predict_worker = None
+_predict_worker_lock = threading.Lock()
+
+def _predict_batch_loop():
+    """Background worker that drains the prediction queue in batches"""
+    while True:
+        batch = [_predict_queue.get()]
+        # Take whatever is already queued, without waiting for more
+        while len(batch) < PREDICT_BATCH_SIZE:
+            try:
+                batch.append(_predict_queue.get_nowait())
+            except queue.Empty:
+                break
+
+        try:
+            categories = predict_categories([text for text, _ in batch])
+        except Exception as e:
+            for _, future in batch:
+                future.set_exception(e)
+            continue
+
+        for (_, future), category in zip(batch, categories):
+            future.set_result(category)
+
+def predict_category_batched(complaint_text: str) -> str:
+    """Queue a lowercased complaint for batched prediction and wait for it"""
+    global _predict_worker
+    # Started lazily so each forked server worker gets its own thread
+    with _predict_worker_lock:
+        if _predict_worker is None or not _predict_worker.is_alive():
+            _predict_worker = threading.Thread(target=_predict_batch_loop, daemon=True)
+            _predict_worker.start()
+
+    future = Future()
+    _predict_queue.put((complaint_text, future))
+    return future.result(timeout=PREDICT_TIMEOUT)
 
 @app.route("/", methods=["GET"])
 def home():
-    return jsonify({
+    return json_response({
         "status": "active",
         "model_version": MODEL_VERSION,
         "endpoints": [
@@ -122,28 +404,27 @@ def predict_category():
             complaint_text = ""
 
         if len(complaint_text) < 10:
-            return jsonify({"error": "Complaint must be at least 10 characters"}), 400
+            return json_response({"error": "Complaint must be at least 10 characters"}, 400)
 
         # First try manual categorization
         manual_category = manual_category_detection(complaint_text)
         
         if manual_category:
+            print(f"🔧 Manual keyword match: {manual_category}")
             predicted_category = manual_category
-        elif model and tfidf_vectorizer and label_encoder:
+        elif (onnx_session or model) and tfidf_vectorizer and label_encoder:
             # Fall back to ML model if manual detection fails
-            complaint_tfidf = tfidf_vectorizer.transform([complaint_text])
-            predicted_category_num = model.predict(complaint_tfidf)[0]
-            predicted_category = label_encoder.inverse_transform([predicted_category_num])[0]
+            predicted_category = predict_category_batched(complaint_text)
             predicted_category = validate_prediction(predicted_category, complaint_text)
         else:
-            # If no model available, use manual detection or default to Other
-            predicted_category = manual_category_detection(complaint_text) or "Other"
+            # No keyword match and no model available, default to Other
+            predicted_category = "Other"
 
         # Final validation
-        if predicted_category not in CATEGORIES:
+        if predicted_category not in CATEGORIES_SET:
             predicted_category = "Other"
 
-        return jsonify({
+        return json_response({
             "category": predicted_category,
             "confidence": 0.85,  # Mock confidence score
             "auto_corrected": bool(manual_category)
@@ -151,7 +432,28 @@ def predict_category():
 
     except Exception as e:
         print(f"❌ Error in predict_category: {e}")
-        return jsonify({"error": "Internal server error"}), 500
+        return json_response({"error": "Internal server error"}, 500)
+
+class SubmitComplaintJSON(msgspec.Struct):
+    """JSON body accepted by /submit_complaint
+
+    Only the complaint text is type-checked; the optional fields accept any
+    JSON value and are normalised in submit_complaint, as before msgspec.
+    """
+    complaint: Optional[str] = None
+    location: Any = ""
+    hasPhoto: Any = False
+    submitted_by: Any = "Anonymous"
+    severity: Any = 5
+    tags: Any = None
+    anonymous: Any = False
+
+def _parse_severity(value) -> int:
+    """Coerce a submitted severity to int, defaulting to 5"""
+    try:
+        return int(value)
+    except (ValueError, TypeError):
+        return 5
 
 @app.route("/submit_complaint", methods=["POST"])
 def submit_complaint():
@@ -160,98 +462,80 @@ def submit_complaint():
         
         # Handle both JSON and form data
         if request.is_json:
-            data = request.json
-            complaint_text = ""
-            location = ""
-            has_photo = False
-            submitted_by = "Anonymous"
-            
-            if data is not None:
-                complaint_text = data.get("complaint", "").strip()
-                location = data.get("location", "")
-                has_photo = data.get("hasPhoto", False)
-                submitted_by = data.get("submitted_by", "Anonymous")
+            try:
+                data = msgspec.json.decode(request.get_data(), type=Optional[SubmitComplaintJSON])
+            except msgspec.DecodeError as e:
+                return json_response({"success": False, "message": f"Invalid complaint data: {e}"}, 400)
+            if data is None:
+                data = SubmitComplaintJSON()
+            complaint_text = (data.complaint or "").strip()
+            location = data.location
+            has_photo = bool(data.hasPhoto)
+            submitted_by = data.submitted_by
+            severity = _parse_severity(data.severity)
+            tags = data.tags if isinstance(data.tags, list) else []
+            anonymous = data.anonymous is True or str(data.anonymous).lower() == "true"
         else:
-            complaint_text = request.form.get("complaint", "").strip()
-            location = request.form.get("location", "Not specified")
+            form = request.form.to_dict()  # Read the MultiDict once
+            complaint_text = form.get("complaint", "").strip()
+            location = form.get("location", "Not specified")
             has_photo = 'photo' in request.files and bool(request.files['photo'].filename)
-            submitted_by = request.form.get("submitted_by", "Anonymous")
+            submitted_by = form.get("submitted_by", "Anonymous")
+            severity = _parse_severity(form.get("severity", 5))
+            try:
+                tags = msgspec.json.decode(form.get("tags", "[]"), type=list)
+            except msgspec.DecodeError:
+                tags = []
+            anonymous = form.get("anonymous", "false").lower() == "true"
 
         print(f"Complaint text: {complaint_text}")
         print(f"Location: {location}")
         
         if len(complaint_text) < 10:
-            return jsonify({"success": False, "message": "Complaint must be at least 10 characters"}), 400
+            return json_response({"success": False, "message": "Complaint must be at least 10 characters"}, 400)
+
+        # Lowercase once and reuse for categorization and priority checks
+        lower_text = complaint_text.lower()
 
         # First try manual categorization
-        manual_category = manual_category_detection(complaint_text.lower())
+        manual_category = manual_category_detection(lower_text)
         
         if manual_category:
+            print(f"🔧 Manual keyword match: {manual_category}")
             predicted_category = manual_category
-        elif model and tfidf_vectorizer and label_encoder:
+        elif (onnx_session or model) and tfidf_vectorizer and label_encoder:
             # Fall back to ML model if manual detection fails
-            complaint_tfidf = tfidf_vectorizer.transform([complaint_text.lower()])
-            predicted_category_num = model.predict(complaint_tfidf)[0]
-            predicted_category = label_encoder.inverse_transform([predicted_category_num])[0]
-            predicted_category = validate_prediction(predicted_category, complaint_text.lower())
+            predicted_category = predict_categories([lower_text])[0]
+            predicted_category = validate_prediction(predicted_category, lower_text)
         else:
-            # If no model available, use manual detection or default to Other
-            predicted_category = manual_category_detection(complaint_text.lower()) or "Other"
+            # No keyword match and no model available, default to Other
+            predicted_category = "Other"
 
         print(f"Predicted category: {predicted_category}")
         
         # Final validation
-        if predicted_category not in CATEGORIES:
+        if predicted_category not in CATEGORIES_SET:
             predicted_category = "Other"
 
         # Generate unique ID for the complaint
-        complaint_id = str(uuid.uuid4())
-        
-        # Get additional fields from form data
-        severity = request.form.get("severity", 5)
-        try:
-            severity = int(severity)
-        except (ValueError, TypeError):
-            severity = 5
-            
-        tags_json = request.form.get("tags", "[]")
-        try:
-            tags = json.loads(tags_json) if isinstance(tags_json, str) else []
-        except (json.JSONDecodeError, TypeError):
-            tags = []
-            
-        anonymous = request.form.get("anonymous", "false").lower() == "true"
+        complaint_id = uuid.uuid4().hex
         
         # Calculate priority score based on severity and keywords
         priority_score = severity  # Start with severity rating
-        if "urgent" in complaint_text.lower() or "emergency" in complaint_text.lower():
+        if PRIORITY_HIGH_PATTERN.search(lower_text):
             priority_score = min(10, priority_score + 2)  # Boost by 2, max 10
-        elif "soon" in complaint_text.lower() or "important" in complaint_text.lower():
+        elif PRIORITY_MEDIUM_PATTERN.search(lower_text):
             priority_score = min(10, priority_score + 1)  # Boost by 1, max 10
             
-        # Handle photo upload if present
-        photo_filename = None
-        if has_photo and 'photo' in request.files:
-            photo = request.files['photo']
-            if photo.filename:
-                try:
-                    photo_filename = secure_filename(f"{complaint_id}_{photo.filename}")
-                    photo_path = os.path.join(app.config['UPLOAD_FOLDER'], photo_filename)
-                    photo.save(photo_path)
-                    print(f"Photo saved at: {photo_path}")
-                except Exception as e:
-                    print(f"Error saving photo: {e}")
-                    photo_filename = None
-            
-        # Store complaint with metadata
+        # Store complaint with metadata; has_photo/photo_path are set once the photo is on disk
         complaint_entry = {
             "_id": complaint_id,
             "complaint": complaint_text,
             "category": predicted_category,
             "location": location,
-            "has_photo": bool(photo_filename),
-            "photo_path": photo_filename,
-            "timestamp": datetime.datetime.utcnow(),
+            "has_photo": False,
+            "photo_path": None,
+            "timestamp": now_ms(),
             "prediction_source": "manual" if manual_category else "model",
             "model_version": MODEL_VERSION,
             "status": "new",
@@ -267,10 +551,31 @@ def submit_complaint():
         print(f"Inserting complaint with ID: {complaint_id}")
         complaints_collection.insert_one(complaint_entry)
         
+        # Handle photo upload if present
+        if has_photo and 'photo' in request.files:
+            photo = request.files['photo']
+            if photo.filename:
+                try:
+                    photo_filename = f"{complaint_id}_{secure_filename(photo.filename)}"
+                    photo_path = os.path.join(app.config['UPLOAD_FOLDER'], photo_filename)
+                    if _upload_slots.acquire(blocking=False):
+                        try:
+                            UPLOAD_EXECUTOR.submit(_write_upload, complaint_id, photo_path, photo_filename, photo.read())
+                        except Exception:
+                            _upload_slots.release()
+                            raise
+                    else:
+                        # Too many writes pending: save inline instead of buffering more
+                        photo.save(photo_path)
+                        _record_photo(complaint_id, photo_filename)
+                        print(f"Photo saved at: {photo_path}")
+                except Exception as e:
+                    print(f"Error saving photo: {e}")
+            
         # Log activity
         log_activity("new_complaint", f"New complaint submitted in {predicted_category} category")
         
-        return jsonify({
+        return json_response({
             "success": True,
             "complaint_id": complaint_id,
             "category": predicted_category,
@@ -278,7 +583,7 @@ def submit_complaint():
         })
     except Exception as e:
         print(f"❌ Error in submit_complaint: {e}")
-        return jsonify({"error": "Internal server error"}), 500
+        return json_response({"error": "Internal server error"}, 500)
 
 @app.route("/update_status", methods=["POST"])
 def update_status():
@@ -293,10 +598,10 @@ def update_status():
             new_status = data.get("status")
         
         if not complaint_id or not new_status:
-            return jsonify({"error": "Missing required fields"}), 400
+            return json_response({"error": "Missing required fields"}, 400)
             
         if new_status not in ["new", "in_progress", "resolved"]:
-            return jsonify({"error": "Invalid status value"}), 400
+            return json_response({"error": "Invalid status value"}, 400)
             
         result = complaints_collection.update_one(
             {"_id": complaint_id},
@@ -304,16 +609,16 @@ def update_status():
         )
         
         if result.matched_count == 0:
-            return jsonify({"error": "Complaint not found"}), 404
+            return json_response({"error": "Complaint not found"}, 404)
             
         # Log activity
         status_text = "New" if new_status == "new" else "In Progress" if new_status == "in_progress" else "Resolved"
         log_activity("status_update", f"Complaint #{complaint_id[:8]} marked as {status_text}")
             
-        return jsonify({"success": True})
+        return json_response({"success": True})
     except Exception as e:
         print(f"❌ Error in update_status: {e}")
-        return jsonify({"error": "Internal server error"}), 500
+        return json_response({"error": "Internal server error"}, 500)
         
 @app.route("/assign_department", methods=["POST"])
 def assign_department():
@@ -328,7 +633,7 @@ def assign_department():
             department = data.get("department")
         
         if not complaint_id or not department:
-            return jsonify({"error": "Missing required fields"}), 400
+            return json_response({"error": "Missing required fields"}, 400)
             
         result = complaints_collection.update_one(
             {"_id": complaint_id},
@@ -336,12 +641,12 @@ def assign_department():
         )
         
         if result.matched_count == 0:
-            return jsonify({"error": "Complaint not found"}), 404
+            return json_response({"error": "Complaint not found"}, 404)
             
-        return jsonify({"success": True})
+        return json_response({"success": True})
     except Exception as e:
         print(f"❌ Error in assign_department: {e}")
-        return jsonify({"error": "Internal server error"}), 500
+        return json_response({"error": "Internal server error"}, 500)
 
 @app.route("/save_admin_note", methods=["POST"])
 def save_admin_note():
@@ -356,12 +661,12 @@ def save_admin_note():
             note_text = data.get("noteText")
         
         if not complaint_id or not note_text:
-            return jsonify({"error": "Missing required fields"}), 400
+            return json_response({"error": "Missing required fields"}, 400)
             
         # Create admin note object
         admin_note = {
             "text": note_text,
-            "timestamp": datetime.datetime.utcnow(),
+            "timestamp": now_ms(),
             "admin": "Administrator"  # In a real app, this would be the logged-in admin
         }
         
@@ -372,33 +677,33 @@ def save_admin_note():
         )
         
         if result.matched_count == 0:
-            return jsonify({"error": "Complaint not found"}), 404
+            return json_response({"error": "Complaint not found"}, 404)
             
-        return jsonify({"success": True, "message": "Admin note saved successfully"})
+        return json_response({"success": True, "message": "Admin note saved successfully"})
     except Exception as e:
         print(f"❌ Error in save_admin_note: {e}")
-        return jsonify({"error": "Internal server error"}), 500
+        return json_response({"error": "Internal server error"}, 500)
 
 @app.route("/upload_photo/<complaint_id>", methods=["POST"])
 def upload_photo(complaint_id):
     """Handle photo upload for a specific complaint"""
     try:
         if 'photo' not in request.files:
-            return jsonify({"error": "No photo part in the request"}), 400
+            return json_response({"error": "No photo part in the request"}, 400)
             
         photo = request.files['photo']
         if photo.filename == '':
-            return jsonify({"error": "No photo selected"}), 400
+            return json_response({"error": "No photo selected"}, 400)
             
         # Check if complaint exists
         complaint = complaints_collection.find_one({"_id": complaint_id})
         if not complaint:
-            return jsonify({"error": "Complaint not found"}), 404
+            return json_response({"error": "Complaint not found"}, 404)
             
         # Save the photo
         filename = f"{complaint_id}.jpg"
         photo_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        photo.save(photo_path)
+        photo.save(photo_path)  # Synchronous: the response hands the path straight to the client
         
         # Update complaint record with photo path
         complaints_collection.update_one(
@@ -406,14 +711,14 @@ def upload_photo(complaint_id):
             {"$set": {"has_photo": True, "photo_path": filename}}
         )
         
-        return jsonify({
+        return json_response({
             "message": "Photo uploaded successfully",
             "photo_path": filename
         })
         
     except Exception as e:
         print(f"❌ Error in upload_photo: {e}")
-        return jsonify({"error": "Internal server error"}), 500
+        return json_response({"error": "Internal server error"}, 500)
 
 @app.route("/photos/<filename>", methods=["GET"])
 def get_photo(filename):
@@ -423,30 +728,36 @@ def get_photo(filename):
 @app.route("/get_categories", methods=["GET"])
 def get_categories():
     try:
-        return jsonify(CATEGORIES)
+        return json_response(CATEGORIES)
     except Exception as e:
         print(f"\u274c Error in get_categories: {e}")
-        return jsonify({"error": str(e)}), 500
+        return json_response({"error": str(e)}, 500)
         
 @app.route('/get_analytics', methods=['GET'])
 def get_analytics():
     try:
-        # Get total complaints count
-        total_complaints = complaints_collection.count_documents({})
-        
-        # Get counts by category
+        # Compute all counts server-side in a single round trip
         pipeline = [
-            {"$group": {"_id": "$category", "count": {"$sum": 1}}},
-            {"$sort": {"count": -1}}
+            {"$facet": {
+                "total": [{"$count": "n"}],
+                "by_category": [
+                    {"$group": {"_id": "$category", "count": {"$sum": 1}}},
+                    {"$sort": {"count": -1}}
+                ],
+                "by_status": [{"$group": {"_id": "$status", "count": {"$sum": 1}}}]
+            }}
         ]
-        category_results = list(complaints_collection.aggregate(pipeline))
-        category_counts = {item['_id']: item['count'] for item in category_results}
+        results = list(complaints_collection.aggregate(pipeline))[0]
         
-        # Get counts by status
-        resolved_count = complaints_collection.count_documents({"status": "resolved"})
-        pending_count = complaints_collection.count_documents({"status": {"$ne": "resolved"}})
+        total_complaints = results['total'][0]['n'] if results['total'] else 0
+        category_counts = {item['_id']: item['count'] for item in results['by_category']}
         
-        return jsonify({
+        # Derive status counts from the status buckets
+        status_counts = {item['_id']: item['count'] for item in results['by_status']}
+        resolved_count = status_counts.get("resolved", 0)
+        pending_count = total_complaints - resolved_count
+        
+        return json_response({
             'total_complaints': total_complaints,
             'category_counts': category_counts,
             'resolved_count': resolved_count,
@@ -454,7 +765,10 @@ def get_analytics():
         })
     except Exception as e:
         print(f"Error in get_analytics: {e}")
-        return jsonify({'error': str(e)}), 500
+        return json_response({'error': str(e)}, 500)
+
+# Unbounded arrays left out of list views; fetch them via /get_complaint/<id>
+COMPLAINT_LIST_PROJECTION = {"comments": 0, "admin_notes": 0, "voters": 0}
 
 @app.route("/get_complaints", methods=["GET"])
 def get_complaints():
@@ -466,7 +780,7 @@ def get_complaints():
         sort_by = request.args.get("sort", "newest")
         page = int(request.args.get("page", 1))
         per_page = int(request.args.get("per_page", 10))
-        search = request.args.get("search", "")
+        search = request.args.get("search", "").strip()
         submitted_by = request.args.get("submitted_by")
         
         # Build query
@@ -480,11 +794,26 @@ def get_complaints():
                 query["status"] = {"$in": statuses}
             else:
                 query["status"] = status
-        if search:
-            query["$text"] = {"$search": search}
         if submitted_by:
             query["submitted_by"] = submitted_by
             
+        # Route search: category keywords become an indexed category filter,
+        # anything else goes to Atlas Search when configured, else $text
+        search_stages = []
+        if search:
+            if len(search) < 3:
+                return json_response({"error": "Search must be at least 3 characters"}, 400)
+            keyword_match = KEYWORD_AUTOMATON.get(search.lower(), None)
+            if keyword_match and "category" not in query:
+                query["category"] = keyword_match[1]
+            elif ATLAS_SEARCH_INDEX:
+                search_stages.append({"$search": {
+                    "index": ATLAS_SEARCH_INDEX,
+                    "text": {"query": search, "path": ["complaint"]}
+                }})
+            else:
+                query["$text"] = {"$search": search}
+            
         # Determine sort order
         if sort_by == "newest":
             sort_order = [("timestamp", -1)]
@@ -500,29 +829,43 @@ def get_complaints():
         # Calculate pagination
         skip = (page - 1) * per_page
         
-        # Create text index if it doesn't exist
-        try:
-            complaints_collection.create_index([("complaint_text", "text")])
-        except Exception as e:
-            print(f"Warning: Could not create text index: {e}")
-        
-        # Execute query
-        total_count = complaints_collection.count_documents(query)
-        complaints = list(complaints_collection.find(
-            query, 
-            sort=sort_order,
-            skip=skip,
-            limit=per_page
-        ))
-        
-        # Convert ObjectId to string for JSON serialization
+        if search_stages:
+            # $search must lead an aggregation; its results carry no index order,
+            # so the page sort is in memory and may spill to disk
+            pipeline = search_stages + [
+                {"$match": query},
+                {"$facet": {
+                    "data": [
+                        {"$sort": dict(sort_order)},
+                        {"$skip": skip},
+                        {"$limit": per_page},
+                        {"$project": COMPLAINT_LIST_PROJECTION}
+                    ],
+                    "total": [{"$count": "n"}]
+                }}
+            ]
+            results = list(complaints_collection.aggregate(pipeline, allowDiskUse=True))[0]
+            complaints = results["data"]
+            total_count = results["total"][0]["n"] if results["total"] else 0
+        else:
+            # find() walks the compound sort indexes and reads only one page;
+            # a $facet here would sort every matched document in memory
+            total_count = complaints_collection.count_documents(query)
+            complaints = list(complaints_collection.find(
+                query,
+                COMPLAINT_LIST_PROJECTION,
+                sort=sort_order,
+                skip=skip,
+                limit=per_page
+            ))
+        
+        # Convert ObjectId to string and any leftover dates to ms for JSON serialization
         for complaint in complaints:
             if "_id" in complaint:
                 complaint["_id"] = str(complaint["_id"])
-            if "timestamp" in complaint:
-                complaint["timestamp"] = complaint["timestamp"].isoformat()
+            normalize_timestamps(complaint)
                 
-        return jsonify({
+        return json_response({
             "complaints": complaints,
             "total": total_count,
             "page": page,
@@ -531,7 +874,21 @@ def get_complaints():
         })
     except Exception as e:
         print(f"❌ Error in get_complaints: {e}")
-        return jsonify({"error": "Internal server error"}), 500
+        return json_response({"error": "Internal server error"}, 500)
+
+@app.route("/get_complaint/<complaint_id>", methods=["GET"])
+def get_complaint(complaint_id):
+    """Get a single complaint including its comments and admin notes"""
+    try:
+        complaint = complaints_collection.find_one({"_id": complaint_id})
+        if not complaint:
+            return json_response({"error": "Complaint not found"}, 404)
+            
+        complaint["_id"] = str(complaint["_id"])
+        return json_response(normalize_timestamps(complaint))
+    except Exception as e:
+        print(f"❌ Error in get_complaint: {e}")
+        return json_response({"error": "Internal server error"}, 500)
 
 @app.route('/vote_complaint', methods=['POST'])
 def vote_complaint():
@@ -547,50 +904,40 @@ def vote_complaint():
             user_email = data.get('userEmail')  # Get the user's email
         
         if not complaint_id:
-            return jsonify({'error': 'Complaint ID is required'}), 400
+            return json_response({'error': 'Complaint ID is required'}, 400)
             
-        # Check if the user has already voted on this complaint
-        complaint = complaints_collection.find_one({'_id': complaint_id})
-        if not complaint:
-            return jsonify({'error': 'Complaint not found'}), 404
-            
-        # Check if user has already voted
-        if user_email:
-            voters = complaint.get('voters', [])
-            if user_email in voters:
-                return jsonify({'error': 'You have already voted on this complaint'}), 400
-        
         # Update vote count
         vote_change = 1 if vote_type == 'upvote' else -1
         
         # Prepare update operations
+        vote_filter = {'_id': complaint_id}
         update_ops = {
             '$inc': {'votes': vote_change, 'priority_score': vote_change * 0.5}
         }
         
-        # Add user to voters list if email is provided
+        # Only match if the user hasn't voted yet, so duplicates are rejected atomically
         if user_email:
+            vote_filter['voters'] = {'$ne': user_email}
             update_ops['$addToSet'] = {'voters': user_email}
         
-        # Update the complaint with the new vote count and voter tracking
-        result = complaints_collection.update_one(
-            {'_id': complaint_id},
-            update_ops
+        # Update the complaint and read back the new counts in one round trip
+        updated_complaint = complaints_collection.find_one_and_update(
+            vote_filter,
+            update_ops,
+            projection={'votes': 1, 'priority_score': 1},
+            return_document=ReturnDocument.AFTER
         )
         
-        if result.modified_count == 0:
-            return jsonify({'error': 'Complaint not found or vote not recorded'}), 404
+        if updated_complaint is None:
+            # Only reached on failure, so the extra lookup is off the hot path
+            if user_email and complaints_collection.count_documents({'_id': complaint_id}, limit=1):
+                return json_response({'error': 'You have already voted on this complaint'}, 400)
+            return json_response({'error': 'Complaint not found'}, 404)
             
-        # Get the updated complaint
-        updated_complaint = complaints_collection.find_one({'_id': complaint_id})
-        votes_count = 0
-        priority_score = 5
-        
-        if updated_complaint is not None:
-            votes_count = updated_complaint.get('votes', 0)
-            priority_score = updated_complaint.get('priority_score', 5)
+        votes_count = updated_complaint.get('votes', 0)
+        priority_score = updated_complaint.get('priority_score', 5)
             
-        return jsonify({
+        return json_response({
             'success': True,
             'message': f'Vote {"added" if vote_type == "upvote" else "removed"}',
             'votes': votes_count,
@@ -598,7 +945,7 @@ def vote_complaint():
         })
     except Exception as e:
         print(f"❌ Error in vote_complaint: {e}")
-        return jsonify({'error': str(e)}), 500
+        return json_response({'error': str(e)}, 500)
         
 @app.route('/add_comment', methods=['POST'])
 def add_comment():
@@ -612,14 +959,14 @@ def add_comment():
             comment_text = data.get('comment')
         
         if not complaint_id or not comment_text:
-            return jsonify({'error': 'Complaint ID and comment text are required'}), 400
+            return json_response({'error': 'Complaint ID and comment text are required'}, 400)
             
         # Create comment object
         comment = {
             'text': comment_text,
-            'timestamp': datetime.datetime.utcnow(),
+            'timestamp': now_ms(),
             'user': 'Anonymous User',  # In a real app, this would be the logged-in user
-            'comment_id': str(uuid.uuid4())  # Generate a unique ID for the comment
+            'comment_id': uuid.uuid4().hex  # Generate a unique ID for the comment
         }
         
         # Add comment to the complaint
@@ -629,51 +976,53 @@ def add_comment():
         )
         
         if result.modified_count == 0:
-            return jsonify({'error': 'Complaint not found or comment not added'}), 404
+            return json_response({'error': 'Complaint not found or comment not added'}, 404)
             
-        return jsonify({
+        return json_response({
             'success': True,
             'message': 'Comment added successfully',
             'comment': comment
         })
     except Exception as e:
         print(f"❌ Error in add_comment: {e}")
-        return jsonify({'error': str(e)}), 500
+        return json_response({'error': str(e)}, 500)
 
 @app.route("/get_recent_activity", methods=["GET"])
 def get_recent_activity():
     """Get recent activity logs"""
     try:
         # Get the 10 most recent activities
-        activities = list(activity_collection.find().sort("timestamp", -1).limit(10))
+        activities = list(activity_collection.find(
+            {}, {"type": 1, "message": 1, "timestamp": 1}
+        ).sort("timestamp", -1).limit(10))
         
-        # Convert ObjectId to string and format timestamp
+        # Convert ObjectId to string and add a relative timestamp
+        now = now_ms()
         for activity in activities:
             if "_id" in activity:
                 activity["_id"] = str(activity["_id"])
             if "timestamp" in activity:
+                timestamp = activity["timestamp"] = timestamp_ms(activity["timestamp"])
+                
                 # Calculate time ago
-                now = datetime.datetime.utcnow()
-                diff = now - activity["timestamp"]
+                seconds = (now - timestamp) / 1000
                 
-                if diff.total_seconds() < 60:
+                if seconds < 60:
                     activity["time_ago"] = "just now"
-                elif diff.total_seconds() < 3600:
-                    minutes = int(diff.total_seconds() / 60)
+                elif seconds < 3600:
+                    minutes = int(seconds / 60)
                     activity["time_ago"] = f"{minutes} minute{'s' if minutes > 1 else ''} ago"
-                elif diff.total_seconds() < 86400:
-                    hours = int(diff.total_seconds() / 3600)
+                elif seconds < 86400:
+                    hours = int(seconds / 3600)
                     activity["time_ago"] = f"{hours} hour{'s' if hours > 1 else ''} ago"
                 else:
-                    days = int(diff.total_seconds() / 86400)
+                    days = int(seconds / 86400)
                     activity["time_ago"] = f"{days} day{'s' if days > 1 else ''} ago"
                 
-                activity["timestamp"] = activity["timestamp"].isoformat()
-                
-        return jsonify(activities)
+        return json_response(activities)
     except Exception as e:
         print(f"Error in get_recent_activity: {e}")
-        return jsonify({"error": str(e)}), 500
+        return json_response({"error": str(e)}, 500)
 
 def log_activity(activity_type, message):
     """Log an activity to the activity collection"""
@@ -681,15 +1030,16 @@ def log_activity(activity_type, message):
         activity = {
             "type": activity_type,
             "message": message,
-            "timestamp": datetime.datetime.utcnow()
+            "timestamp": now_ms()
         }
-        activity_collection.insert_one(activity)
+        activity_log_collection.insert_one(activity)
     except Exception as e:
         print(f"Error logging activity: {e}")
 
 if __name__ == "__main__":
     port = int(os.environ.get("PORT", 5000))
-    app.run(host='0.0.0.0', port=port, debug=True)
+    # Development server only; run under gunicorn in production (see README)
+    app.run(host='0.0.0.0', port=port, debug=os.environ.get("FLASK_DEBUG", "0") == "1")
 
 
 